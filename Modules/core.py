@@ -6,55 +6,50 @@ Final helper module — async download_video, thumbnail generation, upload helpe
 - send_vid(...): async upload with thumbnail generation and rotation fix
 """
 import os
-import sys
+import json
 import time
 import re
-import subprocess
+import shlex
 import logging
 import aiohttp
-import aiofiles
 import asyncio
-from typing import Optional, Tuple
+from collections import defaultdict
+from typing import Optional, Sequence, Tuple, Union
 
 try:
     from pyrogram.types import Message
 except Exception:
     Message = object
 
-# import progress_bar from utils (safe)
+# linear-time regex engine for the progress parser when available
 try:
-    from utils import progress_bar
+    import re2 as _re
 except Exception:
-    async def progress_bar(current, total, message, start):
-        return
+    _re = re
+
+from utils import progress_bar, evict_edit_state, EVICT_INTERVAL, BAR_BLOCKS, BARS
 
 log = logging.getLogger(__name__)
-_h = logging.StreamHandler(sys.stdout)
-_h.setFormatter(logging.Formatter("[%(levelname)s] %(asctime)s - %(message)s"))
-log.addHandler(_h)
 log.setLevel(logging.INFO)
 
 # ---------- edit locking ----------
-_edit_locks = {}
+_edit_locks = defaultdict(asyncio.Lock)
 _last_edit_ts = {}
 _dead_messages = set()
 
+# stale edit state is swept at download start, at most once per EVICT_INTERVAL
+_last_evict = 0.0
+
 def _msg_key(msg_obj):
     try:
         return (getattr(msg_obj, "chat", None).id, getattr(msg_obj, "message_id", None))
     except Exception:
         return id(msg_obj)
 
-async def _locked_edit(msg_obj, text):
-    if msg_obj is None:
-        return False
-    key = _msg_key(msg_obj)
+async def _locked_edit(msg_obj, lock, key, text):
+    """Edit a message under its lock; stops for good once the message is gone."""
     if key in _dead_messages:
         return False
-    lock = _edit_locks.get(key)
-    if lock is None:
-        lock = asyncio.Lock()
-        _edit_locks[key] = lock
     try:
         async with lock:
             try:
@@ -83,78 +78,59 @@ async def _locked_edit(msg_obj, text):
     except Exception:
         return False
 
-def _schedule_edit(msg_obj, text):
-    try:
-        asyncio.get_running_loop().create_task(_locked_edit(msg_obj, text))
-    except Exception:
-        # fallback: try get_event_loop
-        try:
-            asyncio.get_event_loop().create_task(_locked_edit(msg_obj, text))
-        except Exception:
-            pass
-
-async def _safe_edit(msg_obj, text):
-    _schedule_edit(msg_obj, text)
-    await asyncio.sleep(0)
-
 # ---------- progress formatting ----------
+_PROGRESS_TEMPLATE = "\n".join([
+    "`╭─⌯══⟰ 𝐏𝐫𝐨𝐠𝐫𝐞𝐬𝐬 ⟰══⌯──★`",
+    "├⚡ {bar} |﹝{perc:.2f}%﹞",
+    "├🚀 Speed » {speed}",
+    "├📟 Processed » {processed}",
+    "├🧲 Size - ETA » {total} - {eta}",
+    "`├𝐁𝐲 » 𝐖𝐃 𝐙𝐎Ν𝐄`",
+    "╰─══ ✪ @Opleech_WD ✪ ══─★"
+])
+
 def _format_progress_lines(percent: float, processed: str, total: str, speed: str, eta: str) -> str:
     try:
         perc = float(percent)
     except:
         perc = 0.0
-    total_blocks = 18
-    filled = int((perc / 100.0) * total_blocks)
-    bar = "█" * filled + "░" * (total_blocks - filled)
-    lines = [
-        "`╭─⌯══⟰ 𝐏𝐫𝐨𝐠𝐫𝐞𝐬𝐬 ⟰══⌯──★`",
-        f"├⚡ {bar} |﹝{perc:.2f}%﹞",
-        f"├🚀 Speed » {speed}",
-        f"├📟 Processed » {processed}",
-        f"├🧲 Size - ETA » {total} - {eta}",
-        "`├𝐁𝐲 » 𝐖𝐃 𝐙𝐎Ν𝐄`",
-        "╰─══ ✪ @Opleech_WD ✪ ══─★"
-    ]
-    text = "\n".join(lines)
+    filled = int(perc * BAR_BLOCKS / 100.0)
+    filled = 0 if filled < 0 else (BAR_BLOCKS if filled > BAR_BLOCKS else filled)
+    text = _PROGRESS_TEMPLATE.format_map({
+        "bar": BARS[filled], "perc": perc, "speed": speed,
+        "processed": processed, "total": total, "eta": eta,
+    })
     if len(text) > 900:
         text = text[-900:]
     return text
 
-_YT_PERCENT_RE = re.compile(r'(\d{1,3}\.\d+)%')
-_YT_SIZE_RE = re.compile(r'of ~\s*([0-9.,A-Za-z]+)')
-_YT_SPEED_RE = re.compile(r'at\s+([0-9.,A-Za-z]+/s)')
-_YT_ETA_RE = re.compile(r'ETA\s+([0-9:]+)')
+# single pass over the line: percent, size, speed and ETA as named alternatives
+_YT_ALL = _re.compile(
+    r'(?P<pct>\d{1,3}\.\d+)%'
+    r'|of\s*~?\s*(?P<tot>[0-9.,A-Za-z]+)'
+    r'|at\s+(?P<spd>[0-9.,A-Za-z]+/s)'
+    r'|ETA\s+(?P<eta>[0-9:]+)'
+)
 
 def _parse_yt_line(line: str) -> Tuple[float, str, str, str, str]:
-    percent = 0.0
-    processed = ""
-    total = ""
-    speed = ""
-    eta = ""
-    try:
-        m = _YT_PERCENT_RE.search(line)
-        if m:
-            percent = float(m.group(1))
-    except:
-        percent = 0.0
-    try:
-        m = _YT_SIZE_RE.search(line)
-        if m:
-            total = m.group(1)
-    except:
-        total = ""
+    if "%" not in line and "ETA" not in line:
+        return 0.0, "", "", "", ""
+    found = {}
     try:
-        m = _YT_SPEED_RE.search(line)
-        if m:
-            speed = m.group(1)
-    except:
-        speed = ""
+        for m in _YT_ALL.finditer(line):
+            g = m.lastgroup
+            if g not in found:
+                found[g] = m.group(g)
+    except Exception:
+        pass
     try:
-        m = _YT_ETA_RE.search(line)
-        if m:
-            eta = m.group(1)
+        percent = float(found.get("pct", 0.0))
     except:
-        eta = ""
+        percent = 0.0
+    total = found.get("tot", "")
+    speed = found.get("spd", "")
+    eta = found.get("eta", "")
+    processed = ""
     if percent and total:
         processed = f"{percent:.2f}%"
     return percent, processed, total, speed, eta
@@ -165,14 +141,29 @@ async def download(url: str, out_path: str) -> str:
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     timeout = aiohttp.ClientTimeout(total=0)
     headers = {"User-Agent": "Mozilla/5.0 (compatible; Bot/1.0)"}
-    async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
+    async with aiohttp.ClientSession(timeout=timeout, headers=headers, read_bufsize=1 << 20) as session:
         async with session.get(url, allow_redirects=True) as resp:
             if resp.status != 200:
                 raise Exception(f"HTTP {resp.status} for {url}")
             try:
-                async with aiofiles.open(out_path, "wb") as f:
-                    async for chunk in resp.content.iter_chunked(64 * 1024):
-                        await f.write(chunk)
+                # local disk writes into a 1MiB buffer are cheap next to the network;
+                # no thread-pool hop per chunk
+                with open(out_path, "wb", buffering=1 << 20) as f:
+                    # reserve the full size up front so the filesystem allocates extents once
+                    if resp.content_length and hasattr(os, "posix_fallocate"):
+                        try:
+                            os.posix_fallocate(f.fileno(), 0, resp.content_length)
+                        except OSError:
+                            pass
+                    read = resp.content.readany
+                    while True:
+                        chunk = await read()
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                    # Content-Length is the encoded size; a decompressed body can be
+                    # shorter, so drop any preallocated tail
+                    f.truncate(f.tell())
                 return out_path
             except Exception:
                 try:
@@ -183,9 +174,10 @@ async def download(url: str, out_path: str) -> str:
                 raise
 
 # ---------- robust async subprocess streamer ----------
-async def download_video(cmd: str, out_path: str, prog_message: Optional[Message] = None, throttle: float = 1.2):
+async def download_video(cmd: Union[str, Sequence[str]], out_path: str, prog_message: Optional[Message] = None, throttle: float = 1.2):
     """
-    Async downloader: runs cmd with asyncio.create_subprocess_shell, streams stdout in chunks,
+    Async downloader: runs cmd (an argv list, or a string that is shlex-split; never a shell)
+    with asyncio.create_subprocess_exec, streams stdout line by line,
     parses yt-dlp-like lines and edits prog_message periodically.
     Returns absolute filepath on success or False on failure.
     """
@@ -197,84 +189,92 @@ async def download_video(cmd: str, out_path: str, prog_message: Optional[Message
     candidates.extend([f"{base}.mp4", f"{base}.mkv", f"{base}.webm", f"{base}.m4a", f"{base}.mp3", f"{base}.pdf"])
     candidates.insert(0, base)
 
-    log.info(f"download_video: {cmd}")
+    argv = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+    log.info(f"download_video: {shlex.join(argv)}")
     try:
-        proc = await asyncio.create_subprocess_shell(cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+        proc = await asyncio.create_subprocess_exec(
+            *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, limit=1 << 16
+        )
     except Exception:
         log.exception("Failed to start async downloader")
         return False
 
-    buf = ""
-    tail_lines = []
-    last_edit = 0.0
-    key = _msg_key(prog_message) if prog_message is not None else None
+    # newest progress line (raw bytes); the flusher decodes and renders it at most once per throttle interval
+    latest_progress_line = None
+    stop = asyncio.Event()
+    flusher = None
 
+    async def _flush_progress(lock, key):
+        nonlocal latest_progress_line
+        while True:
+            try:
+                await asyncio.wait_for(stop.wait(), throttle)
+            except asyncio.TimeoutError:
+                pass
+            line, latest_progress_line = latest_progress_line, None
+            if line:
+                percent, processed, total, speed, eta = _parse_yt_line(line.decode("ascii", "ignore"))
+                await _locked_edit(prog_message, lock, key, _format_progress_lines(percent, processed, total, speed, eta))
+            if stop.is_set():
+                return
+
+    global _last_evict
+    now = time.time()
+    if now - _last_evict >= EVICT_INTERVAL:
+        _last_evict = now
+        evict_edit_state(now, _last_edit_ts, _edit_locks, _dead_messages)
+
+    if prog_message is not None:
+        key = _msg_key(prog_message)
+        lock = _edit_locks[key]
+        _last_edit_ts[key] = time.time()
+        flusher = asyncio.create_task(_flush_progress(lock, key))
+
+    rc = None
     try:
         while True:
-            chunk = await proc.stdout.read(4096)
-            if not chunk:
-                break
             try:
-                text = chunk.decode(errors="ignore")
-            except:
-                text = str(chunk)
-            buf += text
-            if "\n" in buf:
-                parts = buf.split("\n")
-                complete = parts[:-1]
-                buf = parts[-1]
-                tail_lines.extend(complete)
-                if len(tail_lines) > 80:
-                    tail_lines = tail_lines[-80:]
-            else:
-                # no newline yet, trim buf
-                if len(buf) > 20000:
-                    buf = buf[-20000:]
-
-            now = time.time()
-            send = False
-            # find last line with progress markers
-            last_line = None
-            for t in reversed(tail_lines):
-                tl = t.lower()
-                if "[download]" in tl or "%" in tl or "eta" in tl or "frag" in tl or "downloading" in tl:
-                    last_line = t
-                    send = True
-                    break
-            if not last_line and buf and ("%" in buf or "eta" in buf):
-                last_line = buf
-                send = True
-            if (now - last_edit) >= throttle:
-                send = True
-
-            if send and prog_message is not None and last_line:
-                percent, processed, total, speed, eta = _parse_yt_line(last_line)
-                text = _format_progress_lines(percent, processed, total, speed, eta)
-                _schedule_edit(prog_message, text)
-                last_edit = now
+                raw = await proc.stdout.readline()
+            except ValueError:
+                # line longer than the reader limit; StreamReader has already dropped it
+                continue
+            if not raw:
+                break
+            # every yt-dlp progress line (including fragment progress) carries a percent;
+            # anything else would only overwrite the latest line with an empty render
+            if b"%" not in raw:
+                continue
+            line = raw.rstrip()
+            if b"\r" in line:
+                line = line.rsplit(b"\r", 1)[-1]
+            latest_progress_line = line
 
         rc = await proc.wait()
     except Exception:
         log.exception("Error streaming async downloader")
-        try:
-            proc.kill()
-        except:
-            pass
         return False
+    finally:
+        if flusher is not None:
+            stop.set()
+        # failed or cancelled mid-stream: don't leave yt-dlp or the flusher running
+        if rc is None:
+            if flusher is not None:
+                flusher.cancel()
+            try:
+                proc.kill()
+            except:
+                pass
+            try:
+                await proc.wait()
+            except Exception:
+                pass
 
-    # final update
-    if prog_message is not None and (tail_lines or buf):
-        last_line = None
-        for t in reversed(tail_lines):
-            if "%" in t or "eta" in t or "frag" in t:
-                last_line = t
-                break
-        if not last_line and buf:
-            last_line = buf
-        if last_line:
-            percent, processed, total, speed, eta = _parse_yt_line(last_line)
-            final_text = _format_progress_lines(percent, processed, total, speed, eta)
-            _schedule_edit(prog_message, final_text)
+    # final update: the flusher renders whatever line is still pending, then exits
+    if flusher is not None:
+        try:
+            await flusher
+        except Exception:
+            pass
 
     if rc != 0:
         log.warning(f"Downloader exited with code {rc}")
@@ -299,86 +299,113 @@ async def download_video(cmd: str, out_path: str, prog_message: Optional[Message
 
     return False
 
+# ---------- async subprocess helper ----------
+async def _run(argv, timeout: Optional[float] = None, capture: bool = False) -> Tuple[int, str]:
+    """Run argv without blocking the loop; returns (returncode, stdout text if captured)."""
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE if capture else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        return -1, ""
+    finally:
+        # timed out or cancelled: reap the child instead of orphaning it
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except:
+                pass
+            await proc.wait()
+    return proc.returncode, (out or b"").decode(errors="ignore")
+
 # ---------- thumbnail generation ----------
-def generate_thumbnail_from_video(video_path: str, thumb_path: Optional[str] = None, time_offset: int = 5) -> Optional[str]:
+_THUMB_VF = (
+    "scale='if(gt(a,1280/720),1280,-2)':'if(gt(a,1280/720),-2,720)',"
+    "pad=1280:720:(ow-iw)/2:(oh-ih)/2,setsar=1"
+)
+
+async def generate_thumbnail_from_video(video_path: str, thumb_path: Optional[str] = None, time_offset: int = 5) -> Optional[str]:
     try:
         video_path = os.path.abspath(video_path)
         if thumb_path is None:
             base = os.path.splitext(video_path)[0]
             thumb_path = f"{base}.thumb.jpg"
         thumb_path = os.path.abspath(thumb_path)
-        vf = (
-            "scale='if(gt(a,1280/720),1280,-2)':'if(gt(a,1280/720),-2,720)',"
-            "pad=1280:720:(ow-iw)/2:(oh-ih)/2,setsar=1"
-        )
-        cmd = f'ffmpeg -y -ss {time_offset} -i "{video_path}" -vframes 1 -q:v 2 -vf "{vf}" "{thumb_path}"'
-        rc = subprocess.run(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if rc.returncode == 0 and os.path.isfile(thumb_path):
+        cmd = ["ffmpeg", "-y", "-ss", str(time_offset), "-i", video_path, "-vframes", "1", "-q:v", "2", "-vf", _THUMB_VF, thumb_path]
+        rc, _ = await _run(cmd)
+        if rc == 0 and os.path.isfile(thumb_path):
             return thumb_path
     except Exception:
         pass
     return None
 
 # ---------- rotation fix ----------
-def _fix_rotation(infile: str) -> Optional[str]:
+_NO_PROBE = object()
+
+async def _fix_rotation(infile: str, rotate=_NO_PROBE) -> Optional[str]:
+    """Remux with the rotate tag cleared. Pass `rotate` from _probe_video_metadata to skip the probe."""
     try:
-        p = subprocess.run(
-            f'ffprobe -v error -select_streams v:0 -show_entries stream_tags=rotate -of default=noprint_wrappers=1:nokey=1 "{infile}"',
-            shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=8
-        )
-        rot = p.stdout.strip()
-        if not rot:
+        if rotate is _NO_PROBE:
+            _, out = await _run(
+                ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream_tags=rotate",
+                 "-of", "default=noprint_wrappers=1:nokey=1", infile],
+                timeout=8, capture=True
+            )
+            rot = out.strip()
+        else:
+            rot = "" if rotate is None else str(rotate)
+        # nothing to undo for a missing or zero tag
+        if not rot or int(rot) % 360 == 0:
             return None
         base = os.path.splitext(infile)[0]
         fixed = f"{base}.fixed.mp4"
-        cmd = f'ffmpeg -y -i "{infile}" -c copy -map 0 -metadata:s:v:0 rotate=0 "{fixed}"'
-        rc = subprocess.run(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if rc.returncode == 0 and os.path.isfile(fixed):
+        cmd = ["ffmpeg", "-y", "-i", infile, "-c", "copy", "-map", "0", "-metadata:s:v:0", "rotate=0",
+               "-movflags", "+faststart", fixed]
+        rc, _ = await _run(cmd)
+        if rc == 0 and os.path.isfile(fixed):
             return fixed
     except Exception:
         pass
     return None
 
 # ---------- probe metadata ----------
-def _probe_video_metadata(path: str) -> Tuple[int,int,Optional[int]]:
-    width = 0; height = 0; rotate = None
+async def _probe_video_metadata(path: str) -> Tuple[int, int, Optional[int], int]:
+    """One ffprobe for width, height, rotate tag and duration (seconds)."""
+    width = 0; height = 0; rotate = None; dur = 0
     try:
-        p_w = subprocess.run(f'ffprobe -v error -select_streams v:0 -show_entries stream=width -of csv=p=0 "{path}"', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=6)
-        p_h = subprocess.run(f'ffprobe -v error -select_streams v:0 -show_entries stream=height -of csv=p=0 "{path}"', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=6)
+        _, out = await _run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "stream=width,height:stream_tags=rotate:format=duration",
+             "-of", "json", path],
+            timeout=10, capture=True
+        )
+        info = json.loads(out or "{}")
+        streams = info.get("streams") or [{}]
+        stream = streams[0]
         try:
-            width = int(p_w.stdout.strip())
+            width = int(stream.get("width") or 0)
         except:
             width = 0
         try:
-            height = int(p_h.stdout.strip())
+            height = int(stream.get("height") or 0)
         except:
             height = 0
-        p_rot = subprocess.run(f'ffprobe -v error -select_streams v:0 -show_entries stream_tags=rotate -of default=noprint_wrappers=1:nokey=1 "{path}"', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=6)
-        rot = p_rot.stdout.strip()
+        rot = (stream.get("tags") or {}).get("rotate")
         if rot:
             try:
                 rotate = int(rot)
             except:
                 rotate = None
+        try:
+            dur = int(float((info.get("format") or {}).get("duration") or 0))
+        except:
+            dur = 0
     except Exception:
         pass
-    return width, height, rotate
-
-# ---------- duration ----------
-def duration(filename: str) -> int:
-    try:
-        filename = os.path.abspath(filename)
-        cmd = f'ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 "{filename}"'
-        proc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=10)
-        out = proc.stdout.strip()
-        if out:
-            try:
-                return int(float(out))
-            except:
-                return 0
-    except Exception:
-        pass
-    return 0
+    return width, height, rotate, dur
 
 # ---------- send_vid (upload) ----------
 async def send_vid(bot, m, cc: str, filename: str, thumb, name: str, prog: Optional[Message], target_chat_id):
@@ -407,37 +434,33 @@ async def send_vid(bot, m, cc: str, filename: str, thumb, name: str, prog: Optio
 
     thumb_path = None
     generated_thumb = None
-    try:
-        if thumb and thumb != "no" and isinstance(thumb, str) and os.path.isfile(thumb):
-            thumb_path = thumb
-        else:
-            gen = generate_thumbnail_from_video(filename)
-            if gen:
-                thumb_path = gen
-                generated_thumb = gen
-    except:
-        thumb_path = None
-        generated_thumb = None
+    need_thumb = not (thumb and thumb != "no" and isinstance(thumb, str) and os.path.isfile(thumb))
+    if not need_thumb:
+        thumb_path = thumb
+
+    # thumbnail runs alongside the probe
+    thumb_task = asyncio.create_task(generate_thumbnail_from_video(filename)) if need_thumb else None
+    width, height, rotate, dur = await _probe_video_metadata(filename)
 
     fixed_file = None
+    gen = None
     try:
-        fixed = _fix_rotation(filename)
-        if fixed:
-            fixed_file = fixed
-            use_file = fixed_file
+        if thumb_task is not None:
+            gen, fixed_file = await asyncio.gather(thumb_task, _fix_rotation(filename, rotate))
         else:
-            use_file = filename
+            fixed_file = await _fix_rotation(filename, rotate)
     except:
-        use_file = filename
-
-    width, height, _ = _probe_video_metadata(use_file)
+        pass
+    if gen:
+        thumb_path = gen
+        generated_thumb = gen
+    use_file = fixed_file if fixed_file else filename
 
     async def try_upload(as_video=True, attempts=2):
         last_err = None
         for attempt in range(attempts):
             try:
                 if as_video:
-                    dur = duration(use_file)
                     await bot.send_video(
                         chat_id=target_chat_id,
                         video=use_file,
@@ -465,7 +488,7 @@ async def send_vid(bot, m, cc: str, filename: str, thumb, name: str, prog: Optio
                 try:
                     from pyrogram.errors import FloodWait
                     if isinstance(e, FloodWait):
-                        await asyncio.sleep(int(e.x) + 1)
+                        await asyncio.sleep(int(e.value) + 1)
                         continue
                 except:
                     pass
@@ -1,13 +1,28 @@
 # logs.py
+import os
+import gzip
+import shutil
 import logging
 from logging.handlers import RotatingFileHandler
 
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+# file is opened on first write; rotated backups are gzipped (logs.txt.1.gz, ...)
+_file_handler = RotatingFileHandler("logs.txt", maxBytes=50_000_000, backupCount=5, delay=True)
+_file_handler.namer = lambda name: name + ".gz"
+_file_handler.rotator = _gzip_rotator
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s [%(filename)s:%(lineno)d]",
     datefmt="%d-%b-%y %H:%M:%S",
     handlers=[
-        RotatingFileHandler("logs.txt", maxBytes=50_000_000, backupCount=5),
+        _file_handler,
         logging.StreamHandler(),
     ],
 )
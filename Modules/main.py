@@ -3,14 +3,27 @@ import os
 import re
 import sys
 import json
+import shutil
 import time
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import asyncio
-import requests
+from collections import deque
 
+# libuv event loop when available; must be installed before pyrogram grabs a loop
+try:
+    import uvloop
+    uvloop.install()
+except Exception:
+    pass
+
+import logs  # configures root logging (stdout + rotating logs.txt)
 import core as helper
 from utils import progress_bar
 from vars import API_ID, API_HASH, BOT_TOKEN, WEBHOOK, PORT
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from pyrogram.errors import FloodWait
@@ -28,14 +41,23 @@ except Exception:
     MONGO_DB_NAME = None
 
 USE_MONGO = False
+MONGO_BULK_BATCH = 1000
+_mongo_checked = False
 mongo_client = None
 mongo_db = None
 mongo_collection = None
 
 try:
     if MONGO_URI:
-        from pymongo import MongoClient
-        mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        from pymongo import MongoClient, UpdateOne
+        # construction does not touch the network; the first real use is checked in _ensure_mongo()
+        mongo_client = MongoClient(
+            MONGO_URI,
+            serverSelectionTimeoutMS=3000,
+            compressors="zlib",
+            maxPoolSize=20,
+            retryWrites=True,
+        )
         try:
             if MONGO_DB_NAME:
                 mongo_db = mongo_client[MONGO_DB_NAME]
@@ -45,24 +67,58 @@ try:
             mongo_db = mongo_client['bot_data']
         if mongo_db is not None:
             mongo_collection = mongo_db.get_collection("targets")
-            mongo_client.server_info()
             USE_MONGO = True
-            print("[Bot] MongoDB connected.")
 except Exception as e:
     print(f"[Bot] MongoDB not available or failed to connect: {e}. Falling back to JSON file storage.")
 
+def _ensure_mongo():
+    """Ping MongoDB once, on first use; on failure switch to JSON-only storage."""
+    global USE_MONGO, _mongo_checked
+    if not USE_MONGO or _mongo_checked:
+        return USE_MONGO
+    _mongo_checked = True
+    try:
+        mongo_client.server_info()
+        print("[Bot] MongoDB connected.")
+    except Exception as e:
+        USE_MONGO = False
+        print(f"[Bot] MongoDB not available or failed to connect: {e}. Falling back to JSON file storage.")
+    return USE_MONGO
+
+# an /upload batch occupies one update worker for its whole run, so keep plenty;
+# max_concurrent_transmissions lets send_video push several file parts at once
 bot = Client(
     "bot",
     api_id=API_ID,
     api_hash=API_HASH,
-    bot_token=BOT_TOKEN
+    bot_token=BOT_TOKEN,
+    workers=200,
+    max_concurrent_transmissions=4,
+    sleep_threshold=30,
 )
 
 USER_DATA_FILE = "user_data.json"
 user_targets = {}
 
+# filename sanitizers, compiled once
+_SANITIZE_ORIG = re.compile(r'[^\w\-. ]')
+_SANITIZE_FS = re.compile(r'[\\/<>:"|?*]')
+_NAME_TRANS = str.maketrans('', '', ':/+#|@*.')
+_M3U8_RE = re.compile(r"(https://.*?playlist.m3u8.*?)\"")
+
+# quality reply -> resolution label
+_RES_MAP = {"144": "256x144", "240": "426x240", "360": "640x360",
+            "480": "854x480", "720": "1280x720", "1080": "1920x1080"}
+
+# links downloading concurrently within one /upload batch
+PARALLEL_DOWNLOADS = 3
+
+# one progress line per update, nothing else on the pipe but errors
+YTDLP_FLAGS = ("--newline", "--progress", "--no-warnings", "-q")
+
 DOWNLOADS_DIR = "./downloads"
 TEMP_DIR = os.path.join(DOWNLOADS_DIR, "temp")
+TEMP_PREFIX = TEMP_DIR + os.sep
 
 def ensure_dirs():
     os.makedirs(DOWNLOADS_DIR, exist_ok=True)
@@ -72,47 +128,134 @@ def cleanup_temp_files():
     if not os.path.exists(TEMP_DIR):
         return
     try:
-        for root, dirs, files in os.walk(TEMP_DIR):
-            for f in files:
-                fp = os.path.join(root, f)
-                try:
-                    os.remove(fp)
-                except:
-                    pass
-        for d in os.listdir(TEMP_DIR):
-            dp = os.path.join(TEMP_DIR, d)
-            if os.path.isdir(dp):
-                try:
-                    os.rmdir(dp)
-                except:
-                    pass
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+        os.makedirs(TEMP_DIR, exist_ok=True)
         print(f"[Bot] Cleaned up temp files in {TEMP_DIR}")
     except Exception as e:
         print(f"[Bot] Error cleaning temp files: {e}")
 
-def save_user_data():
+def remove_partials(prefix):
+    """Delete leftover files in TEMP_DIR whose names start with prefix."""
     try:
-        with open(USER_DATA_FILE, "w") as f:
-            json.dump({str(k): v for k, v in user_targets.items()}, f, indent=4)
+        with os.scandir(TEMP_DIR) as it:
+            for entry in it:
+                if entry.name.startswith(prefix) and entry.is_file():
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+    except OSError:
+        pass
+
+def _write_bytes(path, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _dump_user_data(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+def _load_user_data(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# uids changed since the last save; flushed shortly after the latest change
+_dirty_uids = set()
+_save_handle = None
+SAVE_DEBOUNCE = 2.0
+
+def set_user_target(uid, tid):
+    user_targets[uid] = tid
+    _dirty_uids.add(uid)
+    _schedule_save()
+
+def _schedule_save():
+    global _save_handle
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        save_user_data()
+        return
+    # re-arm on every change so the save fires SAVE_DEBOUNCE after the latest one
+    if _save_handle is not None:
+        _save_handle.cancel()
+    _save_handle = loop.call_later(SAVE_DEBOUNCE, _debounced_save)
+
+# the loop only holds tasks weakly; keep running saves here until they finish
+_save_tasks = set()
+
+def _debounced_save():
+    global _save_handle
+    _save_handle = None
+    task = asyncio.create_task(save_user_data_async())
+    _save_tasks.add(task)
+    task.add_done_callback(_save_tasks.discard)
+
+def _save_sync(targets, dirty):
+    """Write the full map to disk and the dirty uids to Mongo; True if both succeeded."""
+    ok = True
+
+    # the JSON file always holds the full map; write a temp file and swap it in
+    tmp_path = USER_DATA_FILE + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_dump_user_data({str(k): v for k, v in targets.items()}))
+        os.replace(tmp_path, USER_DATA_FILE)
     except Exception as e:
+        ok = False
         print(f"[Bot] Error saving user data to file: {e}")
 
-    if USE_MONGO and mongo_collection is not None:
+    if _ensure_mongo() and mongo_collection is not None:
         try:
-            for uid, tid in user_targets.items():
-                mongo_collection.update_one(
-                    {"_id": int(uid)},
-                    {"$set": {"target": int(tid)}},
-                    upsert=True
-                )
-            print("[Bot] Saved user targets to MongoDB.")
+            ops = [
+                UpdateOne({"_id": int(uid)}, {"$set": {"target": int(targets[uid])}}, upsert=True)
+                for uid in dirty if uid in targets
+            ]
+            for i in range(0, len(ops), MONGO_BULK_BATCH):
+                mongo_collection.bulk_write(ops[i:i + MONGO_BULK_BATCH], ordered=False)
+            print(f"[Bot] Saved {len(ops)} user target(s) to MongoDB.")
         except Exception as e:
+            ok = False
             print(f"[Bot] Error saving to MongoDB: {e}")
 
+    return ok
+
+def save_user_data():
+    # blocking save, only for paths without a running loop (shutdown, restart)
+    if not _dirty_uids:
+        return
+    # take the dirty set before writing; changes made meanwhile start a fresh one
+    dirty = set(_dirty_uids)
+    _dirty_uids.clear()
+    if not _save_sync(dict(user_targets), dirty):
+        _dirty_uids.update(dirty)
+
+_save_lock = None
+
+async def save_user_data_async():
+    # snapshot on the loop, then do the disk and Mongo I/O in a worker thread;
+    # the lock keeps two saves from racing on the temp file
+    global _save_lock
+    if _save_lock is None:
+        _save_lock = asyncio.Lock()
+    async with _save_lock:
+        if not _dirty_uids:
+            return
+        dirty = set(_dirty_uids)
+        _dirty_uids.clear()
+        ok = False
+        try:
+            ok = await asyncio.to_thread(_save_sync, dict(user_targets), dirty)
+        finally:
+            if not ok:
+                _dirty_uids.update(dirty)
+
 def load_user_data():
     global user_targets
     user_targets = {}
-    if USE_MONGO and mongo_collection is not None:
+    if _ensure_mongo() and mongo_collection is not None:
         try:
             docs = mongo_collection.find({})
             for doc in docs:
@@ -128,8 +271,8 @@ def load_user_data():
             print(f"[Bot] Error loading from MongoDB: {e}. Falling back to JSON file.")
     try:
         if os.path.exists(USER_DATA_FILE):
-            with open(USER_DATA_FILE, "r") as f:
-                loaded_data = json.load(f)
+            with open(USER_DATA_FILE, "rb") as f:
+                loaded_data = _load_user_data(f.read())
                 user_targets = {int(k): v for k, v in loaded_data.items()}
                 print(f"[Bot] Loaded user data from {USER_DATA_FILE}")
         else:
@@ -138,6 +281,27 @@ def load_user_data():
         print(f"[Bot] Error loading user data: {e}. Starting fresh.")
         user_targets = {}
 
+# bot.get_chat results, keyed by the id/username asked for: {key: (fetched_at, chat)}
+_CHAT_CACHE = {}
+CHAT_CACHE_TTL = 300
+CHAT_CACHE_MAX = 256
+
+async def cached_get_chat(client, chat_id, ttl=CHAT_CACHE_TTL):
+    now = time.time()
+    hit = _CHAT_CACHE.get(chat_id)
+    if hit:
+        if now - hit[0] < ttl:
+            return hit[1]
+        _CHAT_CACHE.pop(chat_id, None)
+    chat = await client.get_chat(chat_id)
+    # re-insert so the dict stays ordered oldest-first, then drop past the cap
+    for key in (chat_id, chat.id):
+        _CHAT_CACHE.pop(key, None)
+        _CHAT_CACHE[key] = (now, chat)
+    while len(_CHAT_CACHE) > CHAT_CACHE_MAX:
+        del _CHAT_CACHE[next(iter(_CHAT_CACHE))]
+    return chat
+
 # web server (optional)
 try:
     from aiohttp import web
@@ -166,6 +330,11 @@ async def account_login(bot: Client, m: Message):
 @bot.on_message(filters.command("stop"))
 async def restart_handler(_, m):
     await m.reply_text("♦ Stopped ♦", True)
+    if _save_handle is not None:
+        _save_handle.cancel()
+    if _save_tasks:
+        await asyncio.gather(*_save_tasks, return_exceptions=True)
+    await save_user_data_async()
     os.execl(sys.executable, sys.executable, *sys.argv)
 
 @bot.on_message(filters.command(["set"]))
@@ -180,9 +349,8 @@ async def set_target_handler(bot: Client, m: Message):
     
     target_str = m.command[1]
     try:
-        chat = await bot.get_chat(target_str)
-        user_targets[m.from_user.id] = chat.id
-        save_user_data()
+        chat = await cached_get_chat(bot, target_str)
+        set_user_target(m.from_user.id, chat.id)
         await m.reply_text(f"✅ **Target channel set!**\n\n**Name:** {chat.title}\n**ID:** `{chat.id}`")
     except Exception as e:
         await m.reply_text(f"❌ **Error setting target:** `{e}`")
@@ -211,8 +379,8 @@ async def account_login(bot: Client, m: Message):
     ensure_dirs()
 
     ts = int(time.time())
-    safe_orig = re.sub(r'[^\w\-. ]', '_', input.document.file_name)
-    temp_txt_path = os.path.join(TEMP_DIR, f"{m.from_user.id}_{ts}_{safe_orig}")
+    safe_orig = _SANITIZE_ORIG.sub('_', input.document.file_name)
+    temp_txt_path = f"{TEMP_PREFIX}{m.from_user.id}_{ts}_{safe_orig}"
 
     try:
         x = await input.download(file_name=temp_txt_path)
@@ -222,14 +390,12 @@ async def account_login(bot: Client, m: Message):
         return
 
     try:
-       with open(x, "r") as f:
-           content = f.read()
-       content = content.splitlines()
        links = []
-       for i in content:
-           if "://" in i:
-               parts = i.split("://", 1)
-               links.append(parts)
+       with open(x, "r", encoding="utf-8", errors="replace") as f:
+           for line in f:
+               left, sep, right = line.partition("://")
+               if sep:
+                   links.append((left, right.rstrip("\n")))
        try:
            os.remove(x)
        except:
@@ -256,23 +422,7 @@ async def account_login(bot: Client, m: Message):
     input2: Message = await bot.listen(editable.chat.id)
     raw_text2 = input2.text
     await input2.delete(True)
-    try:
-        if raw_text2 == "144":
-            res = "256x144"
-        elif raw_text2 == "240":
-            res = "426x240"
-        elif raw_text2 == "360":
-            res = "640x360"
-        elif raw_text2 == "480":
-            res = "854x480"
-        elif raw_text2 == "720":
-            res = "1280x720"
-        elif raw_text2 == "1080":
-            res = "1920x1080" 
-        else: 
-            res = "UN"
-    except Exception:
-            res = "UN"
+    res = _RES_MAP.get(raw_text2, "UN")
     
     await editable.edit("Do you want to add a custom caption (like 'Robin')?\n\nSend `yes` to add, or `no` to skip.")
     input_choice: Message = await bot.listen(editable.chat.id)
@@ -294,13 +444,6 @@ async def account_login(bot: Client, m: Message):
     await input6.delete(True)
     await editable.delete()
 
-    thumb = input6.text
-    if thumb.startswith("http://") or thumb.startswith("https://"):
-        os.system(f"wget '{thumb}' -O 'thumb.jpg'")
-        thumb = "thumb.jpg"
-    else:
-        thumb = "no"
-
     if len(links) == 1:
         count = 1
     else:
@@ -317,28 +460,58 @@ async def account_login(bot: Client, m: Message):
     else:
         try:
             target_chat_id = int(target_chat_id) 
-            chat = await bot.get_chat(target_chat_id) 
+            chat = await cached_get_chat(bot, target_chat_id)
             await m.reply_text(f"✅ **Target channel found!**\n**Name:** {chat.title}\n**ID:** `{chat.id}`")
         except Exception as e:
             await m.reply_text(f"❌ **Error accessing target channel:** `{e}`\nDefaulting to this chat for now.")
             target_chat_id = m.chat.id
 
-    try:
-        for idx in range(count - 1, len(links)):
+    # one pooled session for every page fetch in this batch
+    session = ClientSession(
+        connector=TCPConnector(limit=20, ttl_dns_cache=300, keepalive_timeout=60),
+        headers={'User-Agent': 'Mozilla/5.0'},
+    )
+
+    thumb = input6.text
+    if thumb.startswith(("http://", "https://")):
+        try:
+            async with session.get(thumb) as r:
+                if r.status != 200:
+                    raise Exception(f"HTTP {r.status}")
+                data = await r.read()
+            await asyncio.to_thread(_write_bytes, "thumb.jpg", data)
+            thumb = "thumb.jpg"
+        except Exception as e:
+            print(f"[Bot] Thumbnail download failed: {e}")
+            thumb = "no"
+    else:
+        thumb = "no"
+
+    async def _fetch(idx):
+        """Resolve and download one link; returns what _post needs, or None on failure."""
+        name1 = links[idx][0].replace("\t", "").strip()
+        name_for_file = name1.translate(_NAME_TRANS).replace("https", "").replace("http", "").strip()
+        name = f'{str(idx+1).zfill(3)}) {name_for_file[:60]}'
+        safe_name = _SANITIZE_FS.sub('_', name)
+        try:
             V = links[idx][1].replace("file/d/","uc?export=download&id=").replace("www.youtube-nocookie.com/embed", "youtu.be").replace("?modestbranding=1", "").replace("/view?usp=sharing","")
             url = "https://" + V
 
             if "visionias" in url:
-                async with ClientSession() as session:
-                    async with session.get(url, headers={'User-Agent': 'Mozilla/5.0'}) as resp:
-                        text = await resp.text()
-                        mobj = re.search(r"(https://.*?playlist.m3u8.*?)\"", text)
-                        if mobj:
-                            url = mobj.group(1)
+                async with session.get(url) as resp:
+                    text = await resp.text()
+                    mobj = _M3U8_RE.search(text)
+                    if mobj:
+                        url = mobj.group(1)
 
             elif 'videos.classplusapp' in url:
                 try:
-                    url = requests.get(f'https://api.classplusapp.com/cams/uploader/video/jw-signed-url?url={url}').json().get('url')
+                    api_url = f'https://api.classplusapp.com/cams/uploader/video/jw-signed-url?url={url}'
+                    async with session.get(api_url, timeout=ClientTimeout(total=10)) as r:
+                        data = await r.json(content_type=None)
+                    signed = data.get('url')
+                    if signed:
+                        url = signed
                 except:
                     pass
 
@@ -346,98 +519,102 @@ async def account_login(bot: Client, m: Message):
                 idd = url.split("/")[-2]
                 url = "https://d26g5bnklkwsh4.cloudfront.net/" + idd + "/master.m3u8"
 
-            name1 = links[idx][0].replace("\t", "").strip()
-            name_for_file = name1.replace(":", "").replace("/", "").replace("+", "").replace("#", "").replace("|", "").replace("@", "").replace("*", "").replace(".", "").replace("https", "").replace("http", "").strip()
-            name = f'{str(idx+1).zfill(3)}) {name_for_file[:60]}'
-
             if "youtu" in url:
                 ytf = f"b[height<={raw_text2}][ext=mp4]/bv[height<={raw_text2}][ext=mp4]+ba[ext=m4a]/b[ext=mp4]"
             else:
                 ytf = f"b[height<={raw_text2}]/bv[height<={raw_text2}]+ba/b/bv+ba"
 
-            safe_name = re.sub(r'[\\/<>:"|?*]', '_', name)
-            pdf_out = os.path.join(TEMP_DIR, f"{safe_name}.pdf")
-            base_out = os.path.join(TEMP_DIR, safe_name)
+            base_out = TEMP_PREFIX + safe_name
+            pdf_out = base_out + ".pdf"
+            mp4_out = base_out + ".mp4"
 
             if "jw-prod" in url:
-                cmd = f'yt-dlp -o "{os.path.join(TEMP_DIR, safe_name)}.mp4" "{url}"'
+                cmd = ["yt-dlp", *YTDLP_FLAGS, "-o", mp4_out, url]
             else:
-                cmd = f'yt-dlp -f "{ytf}" "{url}" -o "{os.path.join(TEMP_DIR, safe_name)}.mp4"'
+                cmd = ["yt-dlp", *YTDLP_FLAGS, "-f", ytf, url, "-o", mp4_out]
 
-            try:
-                cc = f'**[ 🎥 ] Vid_ID:** {str(idx+1).zfill(3)}. {name1}{MR}.mkv\n✉️ 𝐁𝐚ᴛᴄʜ » **{raw_text0}**'
-                cc1 = f'**[ 📁 ] Pdf_ID:** {str(idx+1).zfill(3)}. {name1}{MR}.pdf \n✉️ 𝐁𝐚ᴛᴄʜ » **{raw_text0}**'
+            cc = f'**[ 🎥 ] Vid_ID:** {str(idx+1).zfill(3)}. {name1}{MR}.mkv\n✉️ 𝐁𝐚ᴛᴄʜ » **{raw_text0}**'
+            cc1 = f'**[ 📁 ] Pdf_ID:** {str(idx+1).zfill(3)}. {name1}{MR}.pdf \n✉️ 𝐁𝐚ᴛᴄʜ » **{raw_text0}**'
 
-                if "drive" in url or ".pdf" in url:
-                    prog = await m.reply_text(f"❊⟱ 𝐃𝐨𝐰𝐧𝐥𝐨𝐚𝐝𝐢𝐧𝐠 ⟱❊ » `{safe_name}.pdf`")
-                    try:
-                        if ".pdf" in url:
-                            res_file = await helper.download(url, pdf_out)
-                            if not res_file:
-                                await prog.edit("Failed to download PDF.")
-                                continue
-                        else:
-                            # call async download_video and await
-                            res_file = await helper.download_video(cmd, pdf_out, prog)
-                            if res_file is False:
-                                await prog.edit("Failed to download PDF via downloader.")
-                                continue
-                        await prog.delete(True)
-                        await bot.send_document(chat_id=target_chat_id, document=res_file, caption=cc1)
-                        try:
-                            os.remove(res_file)
-                        except:
-                            pass
-                    except FloodWait as e:
-                        await m.reply_text(str(e))
-                        time.sleep(e.x)
-                        continue
-                    except Exception as e:
-                        await prog.edit(f"Error: {e}")
-                        continue
-
-                else:
-                    prog = await m.reply_text(f"❊⟱ 𝐃𝐨𝐰𝐧𝐥𝐨𝐚𝐝𝐢𝐧𝐠 ⟱❊ » `{safe_name}`\n🔗 {url}")
-                    # await async download_video
-                    res_file = await helper.download_video(cmd, base_out, prog)
-                    if res_file is False:
-                        try:
-                            await prog.edit(f"⌘ 𝐃𝐨𝐰𝐧𝐥𝐨𝐚𝐝𝐢𝐧𝐠 𝐈𝐧𝐭𝐞𝐫𝐮𝐩𝐭𝐄𝐃\n⌘ 𝐍𝐚ᴍᴇ » {safe_name}\n⌘ 𝐋𝐢ɴᴋ » `{url}`")
-                        except:
-                            pass
-                        # cleanup partials
-                        try:
-                            for f in os.listdir(TEMP_DIR):
-                                if f.startswith(safe_name):
-                                    try:
-                                        os.remove(os.path.join(TEMP_DIR, f))
-                                    except:
-                                        pass
-                        except:
-                            pass
-                        continue
-
-                    if not os.path.isabs(res_file):
-                        res_file = os.path.abspath(res_file)
-
-                    await helper.send_vid(bot, m, cc, res_file, thumb, name, prog, target_chat_id)
-                    await asyncio.sleep(1)
-
-            except Exception as e:
-                await m.reply_text(f"Error processing {name}: {e}")
+            if "drive" in url or ".pdf" in url:
+                prog = await m.reply_text(f"❊⟱ 𝐃𝐨𝐰𝐧𝐥𝐨𝐚𝐝𝐢𝐧𝐠 ⟱❊ » `{safe_name}.pdf`")
                 try:
-                    for f in os.listdir(TEMP_DIR):
-                        if f.startswith(safe_name):
-                            try:
-                                os.remove(os.path.join(TEMP_DIR, f))
-                            except:
-                                pass
+                    if ".pdf" in url:
+                        res_file = await helper.download(url, pdf_out)
+                        if not res_file:
+                            await prog.edit("Failed to download PDF.")
+                            return None
+                    else:
+                        # call async download_video and await
+                        res_file = await helper.download_video(cmd, pdf_out, prog)
+                        if res_file is False:
+                            await prog.edit("Failed to download PDF via downloader.")
+                            return None
+                except Exception as e:
+                    await prog.edit(f"Error: {e}")
+                    return None
+                return "pdf", res_file, cc1, name, safe_name, prog
+
+            prog = await m.reply_text(f"❊⟱ 𝐃𝐨𝐰𝐧𝐥𝐨𝐚𝐝𝐢𝐧𝐠 ⟱❊ » `{safe_name}`\n🔗 {url}")
+            # await async download_video
+            res_file = await helper.download_video(cmd, base_out, prog)
+            if res_file is False:
+                try:
+                    await prog.edit(f"⌘ 𝐃𝐨𝐰𝐧𝐥𝐨𝐚𝐝𝐢𝐧𝐠 𝐈𝐧𝐭𝐞𝐫𝐮𝐩𝐭𝐄𝐃\n⌘ 𝐍𝐚ᴍᴇ » {safe_name}\n⌘ 𝐋𝐢ɴᴋ » `{url}`")
                 except:
                     pass
-                continue
+                # cleanup partials
+                remove_partials(safe_name)
+                return None
+            return "vid", os.path.abspath(res_file), cc, name, safe_name, prog
+
+        except Exception as e:
+            await m.reply_text(f"Error processing {name}: {e}")
+            remove_partials(safe_name)
+            return None
+
+    async def _post(item):
+        """Upload one fetched link; called strictly in link order."""
+        if item is None:
+            return
+        kind, res_file, caption, name, safe_name, prog = item
+        try:
+            if kind == "pdf":
+                try:
+                    await prog.delete(True)
+                    await bot.send_document(chat_id=target_chat_id, document=res_file, caption=caption)
+                    try:
+                        os.remove(res_file)
+                    except:
+                        pass
+                except FloodWait as e:
+                    await m.reply_text(str(e))
+                    await asyncio.sleep(e.value)
+                except Exception as e:
+                    await prog.edit(f"Error: {e}")
+            else:
+                await helper.send_vid(bot, m, caption, res_file, thumb, name, prog, target_chat_id)
+                await asyncio.sleep(1)
+        except Exception as e:
+            await m.reply_text(f"Error processing {name}: {e}")
+            remove_partials(safe_name)
+
+    # up to PARALLEL_DOWNLOADS links download at once; uploads still go out in order
+    in_flight = deque()
+    try:
+        for idx in range(count - 1, len(links)):
+            in_flight.append(asyncio.create_task(_fetch(idx)))
+            if len(in_flight) >= PARALLEL_DOWNLOADS:
+                await _post(await in_flight.popleft())
+        while in_flight:
+            await _post(await in_flight.popleft())
 
     except Exception as e:
         await m.reply_text(str(e))
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await session.close()
     await m.reply_text("✅ Successfully Done")
 
 async def start_web_server_if_needed():
@@ -467,4 +644,14 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         pass
     except Exception as e:
-        print(f"[Bot] Fatal error in main: {e}")
\ No newline at end of file
+        print(f"[Bot] Fatal error in main: {e}")
+    finally:
+        # let a save already running in a worker thread finish, then flush
+        # anything still waiting on the debounce timer
+        if _save_tasks:
+            try:
+                loop = next(iter(_save_tasks)).get_loop()
+                loop.run_until_complete(asyncio.gather(*_save_tasks, return_exceptions=True))
+            except Exception as e:
+                print(f"[Bot] Error waiting for pending save: {e}")
+        save_user_data()
\ No newline at end of file
@@ -15,20 +15,51 @@ Where `message` is the reply/prog Message object that should be edited.
 
 import asyncio
 import time
-import math
 import logging
+from collections import defaultdict
 
 log = logging.getLogger(__name__)
-_h = logging.StreamHandler()
-_h.setFormatter(logging.Formatter("[%(levelname)s] %(asctime)s - %(message)s"))
-log.addHandler(_h)
 log.setLevel(logging.INFO)
 
 # Per-message locks and last-edit timestamps
-_edit_locks = {}
+_edit_locks = defaultdict(asyncio.Lock)
 _last_edit_time = {}
 # If a message hits a fatal edit error, we mark it so we stop attempting edits
 _dead_messages = set()
+# Latest text waiting to be shown per message, and the single task draining each slot
+_pending_text = {}
+_flushers = {}
+
+# Entries idle longer than this are dropped; the sweep runs at most once per interval
+EDIT_STATE_TTL = 600
+EVICT_INTERVAL = 60
+_last_evict = 0.0
+
+def evict_edit_state(now: float, last_edit: dict, locks: dict, dead: set, busy=()):
+    """
+    Drop per-message edit state (shared by the download and upload progress code)
+    for messages not edited within EDIT_STATE_TTL, plus locks and dead marks left
+    without a timestamp. Held locks and keys in `busy` are kept.
+    """
+    for key in [k for k, ts in last_edit.items() if now - ts > EDIT_STATE_TTL]:
+        if key in busy:
+            continue
+        last_edit.pop(key, None)
+        dead.discard(key)
+        lock = locks.get(key)
+        if lock is not None and not lock.locked():
+            del locks[key]
+    for key in [k for k, lock in locks.items() if k not in last_edit and k not in busy and not lock.locked()]:
+        del locks[key]
+    for key in [k for k in dead if k not in last_edit and k not in busy]:
+        dead.discard(key)
+
+def _evict_if_needed(now: float):
+    global _last_evict
+    if now - _last_evict < EVICT_INTERVAL:
+        return
+    _last_evict = now
+    evict_edit_state(now, _last_edit_time, _edit_locks, _dead_messages, _flushers)
 
 def _msg_key(msg_obj):
     try:
@@ -48,10 +79,8 @@ async def _locked_edit(msg_obj, text):
     if key in _dead_messages:
         return False
 
-    lock = _edit_locks.get(key)
-    if lock is None:
-        lock = asyncio.Lock()
-        _edit_locks[key] = lock
+    # dead messages return above, so they never get a lock
+    lock = _edit_locks[key]
 
     try:
         async with lock:
@@ -75,6 +104,14 @@ async def _locked_edit(msg_obj, text):
                     _dead_messages.add(key)
                     return False
 
+                # Flood wait: sit it out without retrying this (now stale) text;
+                # the flusher picks up whatever arrived in the meantime
+                if err_name == "FloodWait":
+                    wait = getattr(e, "value", None) or getattr(e, "x", 1)
+                    log.debug(f"Progress edit flood wait {wait}s for {key}")
+                    await asyncio.sleep(int(wait) + 1)
+                    return False
+
                 # For other RPC errors (rate limit, socket errors), try a single retry after delay
                 try:
                     await asyncio.sleep(0.8)
@@ -91,23 +128,45 @@ async def _locked_edit(msg_obj, text):
         log.debug(f"_locked_edit unexpected: {e}")
         return False
 
+async def _flush_edits(msg_obj, key):
+    """
+    Drain the pending-text slot for one message until it stays empty.
+    """
+    try:
+        while True:
+            text = _pending_text.pop(key, None)
+            if text is None:
+                return
+            await _locked_edit(msg_obj, text)
+    finally:
+        _flushers.pop(key, None)
+
 def _schedule_edit(msg_obj, text):
     """
-    Schedule a non-blocking locked edit task.
+    Publish the newest text for a message. Only one flusher task runs per message;
+    texts arriving while an edit is in flight overwrite the slot, so stale ones are dropped.
     """
+    key = _msg_key(msg_obj)
+    _pending_text[key] = text
+    if key in _flushers:
+        return
+    coro = _flush_edits(msg_obj, key)
     try:
-        asyncio.get_event_loop().create_task(_locked_edit(msg_obj, text))
-    except Exception as e:
+        _flushers[key] = asyncio.create_task(coro)
+    except RuntimeError as e:
+        coro.close()
+        _pending_text.pop(key, None)
         log.debug(f"_schedule_edit could not schedule: {e}")
 
+_SIZE_UNITS = ("B", "KiB", "MiB", "GiB", "TiB")
+
 def _format_size(bytes_size: float) -> str:
-    if bytes_size < 1024:
-        return f"{bytes_size:.0f} B"
-    units = ["B", "KiB", "MiB", "GiB", "TiB"]
-    i = int(math.floor(math.log(bytes_size, 1024)))
-    p = math.pow(1024, i)
-    s = bytes_size / p
-    return f"{s:.2f} {units[i]}"
+    n = int(bytes_size)
+    if n < 1024:
+        return f"{n} B"
+    # unit index straight from the bit length: every 10 bits is one power of 1024
+    i = min((n.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    return f"{n / (1 << (10 * i)):.2f} {_SIZE_UNITS[i]}"
 
 def _format_eta(start_time: float, processed: int, total: int) -> str:
     if processed <= 0:
@@ -126,11 +185,25 @@ def _format_eta(start_time: float, processed: int, total: int) -> str:
         return f"{m}m {s}s"
     return f"{s}s"
 
+# every possible bar, indexed by filled block count
+BAR_BLOCKS = 18
+BARS = tuple("█" * i + "░" * (BAR_BLOCKS - i) for i in range(BAR_BLOCKS + 1))
+
 def _progress_bar_str(perc: float) -> str:
     # simple visual bar
-    total_blocks = 18
-    filled = int((perc / 100.0) * total_blocks)
-    return "█" * filled + "░" * (total_blocks - filled)
+    filled = int(perc * BAR_BLOCKS / 100.0)
+    filled = 0 if filled < 0 else (BAR_BLOCKS if filled > BAR_BLOCKS else filled)
+    return BARS[filled]
+
+_UPLOAD_TEMPLATE = "\n".join([
+    "`╭─⌯══⟰ 𝐔𝐩𝐥𝐨𝐝𝐢𝐧𝐠 ⟰══⌯──★`",
+    "├⚡ {bar} |﹝{perc:.2f}%﹞",
+    "├🚀 Speed » {sp}",
+    "├📟 Processed » {processed}",
+    "├🧲 Size - ETA » {total_s} - {eta}",
+    "`├𝐁𝐲 » 𝐖𝐃 𝐙𝐎Ν𝐄`",
+    "╰─══ ✪ @Opleech_WD ✪ ══─★"
+])
 
 async def progress_bar(current, total, message, start):
     """
@@ -147,6 +220,12 @@ async def progress_bar(current, total, message, start):
         key = _msg_key(message)
         if key in _dead_messages:
             return
+        # throttle first: at most one edit every 2.5 seconds, and dropped ticks
+        # (most of them on a fast upload) skip all of the formatting below
+        now = time.time()
+        if (now - _last_edit_time.get(key, 0)) < 2.5:
+            return
+        _evict_if_needed(now)
     except Exception:
         # if something about message fails, bail silently
         return
@@ -171,7 +250,7 @@ async def progress_bar(current, total, message, start):
     try:
         sp = "0B/s"
         if start and cur > 0:
-            elapsed = max(1e-6, time.time() - start)
+            elapsed = max(1e-6, now - start)
             speed = cur / elapsed
             sp = _format_size(speed) + "/s"
         processed = _format_size(cur)
@@ -187,24 +266,10 @@ async def progress_bar(current, total, message, start):
         eta = "Unknown"
 
     # build message text (mirror the old layout as much as possible)
-    text_lines = [
-        "`╭─⌯══⟰ 𝐔𝐩𝐥𝐨𝐝𝐢𝐧𝐠 ⟰══⌯──★`",
-        f"├⚡ {bar} |﹝{perc:.2f}%﹞",
-        f"├🚀 Speed » {sp}",
-        f"├📟 Processed » {processed}",
-        f"├🧲 Size - ETA » {total_s} - {eta}",
-        "`├𝐁𝐲 » 𝐖𝐃 𝐙𝐎Ν𝐄`",
-        "╰─══ ✪ @Opleech_WD ✪ ══─★"
-    ]
-    full_text = "\n".join(text_lines)
-
-    # throttle and limit length
+    full_text = _UPLOAD_TEMPLATE.format(bar=bar, perc=perc, sp=sp, processed=processed, total_s=total_s, eta=eta)
+
+    # limit length
     try:
-        last_ts = _last_edit_time.get(key, 0)
-        now = time.time()
-        # At most once every 2.5 seconds
-        if (now - last_ts) < 2.5:
-            return
         # cap message length
         if len(full_text) > 800:
             full_text = full_text[-800:]